@@ -1,47 +1,75 @@
 import re
+import os
+import glob
 import argparse
 import pandas as pd
 import numpy as np
 import xarray as xr
 from datetime import datetime, timedelta, UTC
+from multiprocessing import Pool
+
+# Header patterns, compiled once at import instead of on every line
+_RE_START = re.compile(r"# start_time\s*=\s*(.*)\s+\[")
+_RE_NAME = re.compile(r"# name \d+ = (.+?):")
+_RE_UNIT = re.compile(r"\[([^\]]+)\]")
+
+# CF standard-name lookup for CNV columns: one compiled alternation scan
+# per column instead of a substring test per map entry
+_STD_MAP = {
+    "temperature": "sea_water_temperature",
+    "salinity": "sea_water_practical_salinity",
+    "pressure": "sea_water_pressure",
+    "depth": "depth",
+    "fluorescence": "volume_scattering_function",
+}
+_STD_RE = re.compile("|".join(_STD_MAP))
 
 def parse_cnv(filepath):
-    with open(filepath, 'r') as file:
-        lines = file.readlines()
-
     variable_names = []
     units = []
-    header_lines = []
     start_time = None
 
-    for i, line in enumerate(lines):
-        if line.strip() == "*END*":
-            data_start = i + 1
-            break
-        header_lines.append(line)
-
-        # Parse start_time
-        if "start_time" in line.lower():
-            match = re.search(r"# start_time\s*=\s*(.*)\s+\[", line)
+    # Stream the header lazily; only the lines up to *END* are ever read here,
+    # read_csv re-opens the file itself with skiprows for the data block.
+    with open(filepath, 'r') as file:
+        for i, line in enumerate(file):
+            if line.strip() == "*END*":
+                data_start = i + 1
+                break
+
+            # Parse start_time
+            if "start_time" in line.lower():
+                match = _RE_START.search(line)
+                if match:
+                    start_time = match.group(1).strip()
+
+            # Parse variable names and units
+            match = _RE_NAME.match(line)
             if match:
-                start_time = match.group(1).strip()
-
-        # Parse variable names and units
-        match = re.match(r"# name \d+ = (.+?):", line)
-        if match:
-            variable = match.group(1).strip()
-            variable_names.append(variable)
-            unit_match = re.search(r"\[([^\]]+)\]", line)
-            units.append(unit_match.group(1) if unit_match else "")
-
-    df = pd.read_csv(filepath, skiprows=data_start, sep=r'\s+', engine='python', names=variable_names)
-    df = df.apply(pd.to_numeric, errors='coerce')
+                variable = match.group(1).strip()
+                variable_names.append(variable)
+                unit_match = _RE_UNIT.search(line)
+                units.append(unit_match.group(1) if unit_match else "")
+
+    # The C engine tokenizes whitespace-separated floats much faster than the
+    # pure-Python parser, and dtype=float64 skips type inference on clean
+    # files. The C parser raises on non-numeric tokens instead of coercing
+    # them, though, and real CNV files do contain stray tokens — fall back
+    # to an untyped read plus to_numeric coercion in that case.
+    try:
+        df = pd.read_csv(filepath, skiprows=data_start, sep=r'\s+', engine='c',
+                         names=variable_names, dtype=np.float64,
+                         na_values=["", "NaN"], header=None)
+    except ValueError:
+        df = pd.read_csv(filepath, skiprows=data_start, sep=r'\s+', engine='c',
+                         names=variable_names, na_values=["", "NaN"], header=None)
+        df = df.apply(pd.to_numeric, errors='coerce')
 
     return df, variable_names, units, start_time
 
 
 def create_cf_netcdf(df, variable_names, units, start_time_str, output_path):
-    ds = xr.Dataset()
+    data_vars = {}
     obs_len = len(df)
 
     # Start time handling
@@ -50,58 +78,67 @@ def create_cf_netcdf(df, variable_names, units, start_time_str, output_path):
     else:
         start_time = datetime.now(UTC)
 
-    # Time conversion
+    # Time conversion (vectorized: julian days -> seconds since epoch in float64,
+    # avoiding one datetime/timedelta object per row)
     if "timeJ" in df.columns:
         base = datetime(start_time.year, 1, 1, tzinfo=UTC)
-        time_julian = df["timeJ"]
-        time_datetimes = [base + timedelta(days=float(jd)) for jd in time_julian]
-        seconds_since_epoch = [(dt - datetime(1970, 1, 1, tzinfo=UTC)).total_seconds() for dt in time_datetimes]
-        ds["time"] = ("obs", np.array(seconds_since_epoch))
-        ds["time"].attrs.update({
+        base_epoch = (base - datetime(1970, 1, 1, tzinfo=UTC)).total_seconds()
+        jd = df["timeJ"].to_numpy(dtype=np.float64, copy=False)
+        seconds_since_epoch = base_epoch + jd * 86400.0
+        data_vars["time"] = (("trajectory", "obs"), seconds_since_epoch[np.newaxis, :], {
             "standard_name": "time",
             "units": "seconds since 1970-01-01T00:00:00Z",
             "calendar": "gregorian",
             "axis": "T"
         })
     else:
-        ds["time"] = ("obs", [np.datetime64(start_time)] * obs_len)
+        data_vars["time"] = (("trajectory", "obs"),
+                             np.full((1, obs_len), np.datetime64(start_time)))
 
     # Coordinates
     lat_col = next((c for c in df.columns if "lat" in c.lower()), None)
     lon_col = next((c for c in df.columns if "lon" in c.lower()), None)
-    ds["lat"] = ("obs", df[lat_col].values if lat_col else [np.nan] * obs_len)
-    ds["lon"] = ("obs", df[lon_col].values if lon_col else [np.nan] * obs_len)
-
-    ds["lat"].attrs.update({"standard_name": "latitude", "units": "degrees_north", "axis": "Y"})
-    ds["lon"].attrs.update({"standard_name": "longitude", "units": "degrees_east", "axis": "X"})
-
-    # CF variable names
-    standard_name_map = {
-        "temperature": "sea_water_temperature",
-        "salinity": "sea_water_practical_salinity",
-        "pressure": "sea_water_pressure",
-        "depth": "depth",
-        "fluorescence": "volume_scattering_function"
-    }
-
+    lat_vals = df[lat_col].values if lat_col else np.full(obs_len, np.nan)
+    lon_vals = df[lon_col].values if lon_col else np.full(obs_len, np.nan)
+    data_vars["lat"] = (("trajectory", "obs"), lat_vals[np.newaxis, :],
+                        {"standard_name": "latitude", "units": "degrees_north", "axis": "Y"})
+    data_vars["lon"] = (("trajectory", "obs"), lon_vals[np.newaxis, :],
+                        {"standard_name": "longitude", "units": "degrees_east", "axis": "X"})
+
+    # Pull the data block once as a 2-D ndarray; column slices are views,
+    # so no per-column Series construction in the loop
+    arr = df.to_numpy()
     for i, col in enumerate(df.columns):
         var_name = col.lower().replace(" ", "_")
-        standard_name = next((v for k, v in standard_name_map.items() if k in var_name), None)
+        match = _STD_RE.search(var_name)
+        standard_name = _STD_MAP[match.group(0)] if match else None
 
-        ds[var_name] = ("obs", df[col].values)
-        ds[var_name].attrs["long_name"] = variable_names[i]
-        ds[var_name].attrs["units"] = units[i] if i < len(units) else ""
+        attrs = {
+            "long_name": variable_names[i],
+            "units": units[i] if i < len(units) else ""
+        }
         if standard_name:
-            ds[var_name].attrs["standard_name"] = standard_name
+            attrs["standard_name"] = standard_name
+        data_vars[var_name] = (("trajectory", "obs"), arr[:, i][np.newaxis, :], attrs)
 
-    ds = ds.expand_dims("trajectory")
+    # Build the Dataset in one call instead of N __setitem__ index rebuilds;
+    # variables are created with the (trajectory, obs) shape directly, so no
+    # expand_dims pass over every variable is needed afterwards
+    ds = xr.Dataset(data_vars=data_vars)
     ds["trajectory"] = ("trajectory", ["trajectory_001"])
     ds["trajectory"].attrs["cf_role"] = "trajectory_id"
 
-    # Global attributes
-    time_coverage_start = ds["time"].values[0].astype("M8[s]").astype(str)
-    time_coverage_end = ds["time"].values[-1].astype("M8[s]").astype(str)
-    duration = str(ds["time"].values[-1] - ds["time"].values[0])
+    # Global attributes: format only the first/last timestamps as scalars
+    # instead of string-converting the whole time array
+    if "timeJ" in df.columns:
+        t0 = float(seconds_since_epoch[0])
+        t1 = float(seconds_since_epoch[-1])
+        time_coverage_start = datetime.fromtimestamp(t0, UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+        time_coverage_end = datetime.fromtimestamp(t1, UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+        duration = str(timedelta(seconds=t1 - t0))
+    else:
+        time_coverage_start = time_coverage_end = start_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        duration = str(timedelta(0))
 
     ds.attrs.update({
         "title": "EAF-Nansen Programme CTD Data",
@@ -117,17 +154,52 @@ def create_cf_netcdf(df, variable_names, units, start_time_str, output_path):
         "time_coverage_duration": duration
     })
 
-    ds.to_netcdf(output_path, format="NETCDF4", engine="netcdf4")
+    # Chunked zlib compression keeps the write disk-bandwidth friendly
+    obs_chunk = min(ds.sizes["obs"], 65536)
+    encoding = {
+        v: {"zlib": True, "complevel": 4, "shuffle": True,
+            "chunksizes": (1, obs_chunk)}
+        for v in ds.data_vars if ds[v].dims == ("trajectory", "obs")
+    }
+    ds.to_netcdf(output_path, format="NETCDF4", engine="netcdf4", encoding=encoding)
     print(f"✅ NetCDF written to: {output_path}")
 
 
+def _convert_one(io):
+    """Worker for batch mode: convert a single (input, output) pair."""
+    input_path, output_path = io
+    df, variable_names, units, start_time = parse_cnv(input_path)
+    create_cf_netcdf(df, variable_names, units, start_time, output_path)
+
+
 if __name__ == "__main__":
     # 🔹 Argument parser for terminal usage
     parser = argparse.ArgumentParser(description="Convert a Sea-Bird .cnv file to CF-compliant NetCDF.")
-    parser.add_argument("--input", "-i", required=True, help="Path to input CNV file")
-    parser.add_argument("--output", "-o", required=True, help="Path to output NetCDF file")
+    parser.add_argument("--input", "-i", help="Path to input CNV file")
+    parser.add_argument("--output", "-o", help="Path to output NetCDF file")
+    parser.add_argument("--batch", "-b", help="Glob of CNV files to convert in parallel")
+    parser.add_argument("--outdir", "-d", help="Output directory for batch mode")
 
     args = parser.parse_args()
 
-    df, variable_names, units, start_time = parse_cnv(args.input)
-    create_cf_netcdf(df, variable_names, units, start_time, args.output)
\ No newline at end of file
+    if args.batch:
+        # Parallel conversion of many casts: each worker imports the heavy
+        # pandas/xarray stack once instead of once per shell invocation
+        if not args.outdir:
+            parser.error("--outdir is required with --batch")
+        inputs = sorted(glob.glob(args.batch))
+        if not inputs:
+            parser.error(f"no files match {args.batch}")
+        os.makedirs(args.outdir, exist_ok=True)
+        pairs = [
+            (path, os.path.join(args.outdir, os.path.splitext(os.path.basename(path))[0] + ".nc"))
+            for path in inputs
+        ]
+        with Pool(processes=min(os.cpu_count(), len(pairs))) as pool:
+            pool.map(_convert_one, pairs)
+        print(f"✅ Converted {len(pairs)} CNV files into: {args.outdir}")
+    else:
+        if not (args.input and args.output):
+            parser.error("--input and --output are required unless --batch is given")
+        df, variable_names, units, start_time = parse_cnv(args.input)
+        create_cf_netcdf(df, variable_names, units, start_time, args.output)
\ No newline at end of file
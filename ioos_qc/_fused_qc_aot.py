@@ -0,0 +1,23 @@
+"""
+Ahead-of-time build for the fused QC kernel.
+
+Run ``python _fused_qc_aot.py`` in this directory to compile the kernel
+into a ``_fused_qc_aot`` extension module. fused_qc imports the compiled
+module automatically when it exists, so short runs (typical CTD casts)
+skip Numba's per-process JIT warm-up entirely.
+
+Re-run the build after any change to the kernel in fused_qc.py: an
+existing extension module takes precedence over the JIT path, so a stale
+build would silently keep serving the old kernel.
+"""
+from numba.pycc import CC
+from fused_qc import _combined_qc_impl
+
+cc = CC("_fused_qc_aot")
+cc.export(
+    "combined_qc",
+    "i1[:](f8[:], f8[:], f8, f8, f8, f8, f8, f8, f8, f8, f8, f8)",
+)(_combined_qc_impl)
+
+if __name__ == "__main__":
+    cc.compile()
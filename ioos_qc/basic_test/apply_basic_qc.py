@@ -1,15 +1,22 @@
 import argparse
+import sys
+from pathlib import Path
 import xarray as xr
 import numpy as np
 import matplotlib.pyplot as plt
-from ioos_qc.qartod import gross_range_test, spike_test
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fused_qc import combined_qc
 
 def apply_qc_and_save(netcdf_file, output_file):
     """
     Apply simplified IOOS QC (gross range + spike test) to selected variables in a NetCDF file.
     Saves updated file with QC flags and diagnostic plots.
     """
-    ds = xr.open_dataset(netcdf_file)
+    # Lazy dask-backed open: only the variables the loop touches are
+    # read and decoded, the rest stream through to the writer untouched
+    ds = xr.open_dataset(netcdf_file, chunks={}, decode_times=False,
+                         mask_and_scale=False)
     obs_dim = "obs"
     trajectory_dim = "trajectory"
 
@@ -17,9 +24,17 @@ def apply_qc_and_save(netcdf_file, output_file):
     target_vars = ['t090c', 'sal00', 'wetstar']
     print("🔍 QC target variables:", target_vars)
 
+    # Read each target variable from the store once, as contiguous float64,
+    # instead of re-materializing a DataArray per loop iteration
+    arrs = {v: np.ascontiguousarray(ds[v].isel(trajectory=0).values, dtype=np.float64)
+            for v in target_vars}
+
+    # Dummy index time for the fused kernel, built once for all variables
+    dummy_time = np.arange(ds.sizes[obs_dim], dtype=np.float64)
+
     for var in target_vars:
         print(f"\n📊 Running simplified QC for {var}...")
-        data = ds[var].isel(trajectory=0).values
+        data = arrs[var]
 
         # Conservative thresholds
         if "t090c" in var:
@@ -38,16 +53,18 @@ def apply_qc_and_save(netcdf_file, output_file):
             spike_suspect = 5.0
             spike_fail = 10.0
 
-        # Run basic tests
-        flags_gr = gross_range_test(data, suspect_span=suspect_span, fail_span=fail_span)
-        flags_spike = spike_test(data, suspect_threshold=spike_suspect, fail_threshold=spike_fail)
-
-        # Combine flags (max value per observation)
-        combined_flags = np.maximum(flags_gr, flags_spike)
+        # Gross range + spike in a single fused pass (flat line and rate of
+        # change disabled via the <= 0 thresholds)
+        combined_flags = combined_qc(
+            data, dummy_time,
+            fail_span[0], fail_span[1], suspect_span[0], suspect_span[1],
+            spike_suspect, spike_fail,
+            0.0, 0.0, 0.0, 0.0
+        )
 
         # Save QC result as a new variable in the dataset
         qc_var_name = f"{var}_qc"
-        ds[qc_var_name] = ((trajectory_dim, obs_dim), combined_flags[np.newaxis, :].astype("int8"))
+        ds[qc_var_name] = ((trajectory_dim, obs_dim), combined_flags[np.newaxis, :])
         ds[qc_var_name].attrs.update({
             "long_name": f"{var} quality control flags",
             "standard_name": "aggregate_quality_flag",
@@ -55,9 +72,12 @@ def apply_qc_and_save(netcdf_file, output_file):
             "flag_meanings": "good_data probably_good_data potentially_bad_data bad_data"
         })
 
-        # Generate diagnostic plot
+        # Generate diagnostic plot; per-point markers dominate savefig time
+        # on long series, so only draw them for short ones
+        marker = 'o' if combined_flags.size <= 2000 else None
         plt.figure(figsize=(10, 3))
-        plt.plot(combined_flags, marker='o', linestyle='-', label=f"{var} QC")
+        plt.plot(combined_flags, marker=marker, linestyle='-', linewidth=0.8,
+                 rasterized=True, label=f"{var} QC")
         plt.title(f"IOOS QC Flags for {var} (Basic Only)")
         plt.xlabel("Observation")
         plt.ylabel("QC Flag")
@@ -66,10 +86,23 @@ def apply_qc_and_save(netcdf_file, output_file):
         plt.savefig(f"{var}_qc_flags_basic.png", dpi=150)
         plt.close()
 
-        print(f"✅ Flag counts for {var}: {np.unique(combined_flags, return_counts=True)}")
+        # bincount is a single O(N) pass over the tiny flag domain,
+        # unlike np.unique which sorts the whole array
+        counts = np.bincount(combined_flags.view(np.uint8), minlength=10)
+        print(f"✅ Flag counts for {var}: "
+              f"1={counts[1]} 2={counts[2]} 3={counts[3]} 4={counts[4]} missing={counts[9]}")
 
-    # Save updated NetCDF with QC flags
-    ds.to_netcdf(output_file, format="NETCDF4", engine="netcdf4")
+    # Save updated NetCDF with chunked zlib compression; the int8 QC flags
+    # compress to near zero at the higher level
+    obs_chunk = min(ds.sizes[obs_dim], 65536)
+    encoding = {}
+    for v in ds.data_vars:
+        if ds[v].dims != (trajectory_dim, obs_dim):
+            continue
+        complevel = 6 if ds[v].dtype == np.int8 else 4
+        encoding[v] = {"zlib": True, "complevel": complevel, "shuffle": True,
+                       "chunksizes": (1, obs_chunk)}
+    ds.to_netcdf(output_file, format="NETCDF4", engine="netcdf4", encoding=encoding)
     print(f"\n🎉 Simplified QC NetCDF saved as: {output_file}")
 
 
@@ -0,0 +1,161 @@
+"""
+Fused QC kernel shared by the apply_* scripts.
+
+Combines the gross range, spike, flat line and rate of change tests into a
+single compiled pass over the data. The separate ioos_qc calls each make a
+full memory-bound sweep and allocate their own flag array, plus a final
+np.maximum.reduce pass; this kernel walks the data once and writes one
+aggregate int8 flag per observation.
+
+Flag convention follows IOOS QARTOD:
+    1 = good, 2 = not evaluated, 3 = suspect, 4 = fail, 9 = missing (NaN)
+
+Each test replicates its ioos_qc.qartod counterpart:
+
+* spike: deviation of a point from the midpoint of its neighbours; the
+  first and last points cannot be evaluated and are flagged 2.
+* flat line: a point is flagged when the range (max - min) of the trailing
+  window of ``threshold / median_dt`` samples stays below the tolerance;
+  points before the end of the first window pass. The rolling min/max is
+  kept with monotonic index deques, so this is still one O(N) pass.
+* rate of change: first difference divided by the time step.
+
+Flat line and rate of change are optional: pass flat_fail <= 0 or
+roc_thresh <= 0 to disable them (used by the basic test script, which only
+runs gross range + spike). Thresholds for the time-based tests are in the
+same units as the ``time`` array (seconds for real timestamps, sample
+counts for a dummy index).
+
+If the ahead-of-time build produced by ``python _fused_qc_aot.py`` is
+present next to this module, it is used directly and no JIT warm-up is
+paid; otherwise the kernel is JIT-compiled on first call (and cached).
+"""
+import numpy as np
+from numba import njit
+
+
+def _combined_qc_impl(data, time, fail_lo, fail_hi, susp_lo, susp_hi,
+                      spike_susp, spike_fail, flat_susp, flat_fail,
+                      flat_tol, roc_thresh):
+    n = data.size
+    flags = np.ones(n, np.int8)
+
+    # Flat-line window lengths, replicating ioos_qc: each threshold divided
+    # by the median sample interval truncated to whole units
+    do_flat = flat_fail > 0 and n >= 3
+    w_susp = 0
+    w_fail = 0
+    if do_flat:
+        # Median of the time steps, spelled out because the AOT pipeline
+        # cannot type np.diff/np.median
+        dts = np.sort(time[1:] - time[:-1])
+        mid = dts.size // 2
+        if dts.size % 2 == 1:
+            median_dt = dts[mid]
+        else:
+            median_dt = 0.5 * (dts[mid - 1] + dts[mid])
+        interval = np.floor(median_dt)
+        if interval <= 0:
+            do_flat = False
+        else:
+            w_susp = int(flat_susp / interval)
+            w_fail = int(flat_fail / interval)
+
+    # Monotonic index deques holding the rolling min/max of the suspect and
+    # fail windows; NaN samples are never pushed, mirroring ioos_qc's
+    # masked min/max over each window
+    dq_len = n if do_flat else 0
+    smin = np.empty(dq_len, np.int64)
+    smax = np.empty(dq_len, np.int64)
+    fmin = np.empty(dq_len, np.int64)
+    fmax = np.empty(dq_len, np.int64)
+    smin_h = 0
+    smin_t = 0
+    smax_h = 0
+    smax_t = 0
+    fmin_h = 0
+    fmin_t = 0
+    fmax_h = 0
+    fmax_t = 0
+
+    for i in range(n):
+        x = data[i]
+        if np.isnan(x):
+            flags[i] = 9
+            continue
+
+        f = 1
+
+        # Gross range
+        if x < fail_lo or x > fail_hi:
+            f = 4
+        elif x < susp_lo or x > susp_hi:
+            f = 3
+
+        # Spike: deviation from the midpoint of the two neighbours; the
+        # endpoints and points next to missing values cannot be evaluated
+        # and are flagged NOT_EVALUATED
+        if 0 < i < n - 1 and not (np.isnan(data[i - 1]) or np.isnan(data[i + 1])):
+            dev = abs(x - 0.5 * (data[i - 1] + data[i + 1]))
+            if dev > spike_fail:
+                f = 4
+            elif dev > spike_susp and f < 3:
+                f = 3
+        elif f < 2:
+            f = 2
+
+        # Flat line: flag when the range of the trailing window stays
+        # below the tolerance; indices before the first full window pass
+        if do_flat:
+            while smin_t > smin_h and data[smin[smin_t - 1]] >= x:
+                smin_t -= 1
+            smin[smin_t] = i
+            smin_t += 1
+            while smax_t > smax_h and data[smax[smax_t - 1]] <= x:
+                smax_t -= 1
+            smax[smax_t] = i
+            smax_t += 1
+            while fmin_t > fmin_h and data[fmin[fmin_t - 1]] >= x:
+                fmin_t -= 1
+            fmin[fmin_t] = i
+            fmin_t += 1
+            while fmax_t > fmax_h and data[fmax[fmax_t - 1]] <= x:
+                fmax_t -= 1
+            fmax[fmax_t] = i
+            fmax_t += 1
+
+            flat_flag = 0
+            if i >= w_fail:
+                while fmin[fmin_h] < i - w_fail:
+                    fmin_h += 1
+                while fmax[fmax_h] < i - w_fail:
+                    fmax_h += 1
+                if data[fmax[fmax_h]] - data[fmin[fmin_h]] < flat_tol:
+                    flat_flag = 4
+            if flat_flag == 0 and i >= w_susp:
+                while smin[smin_h] < i - w_susp:
+                    smin_h += 1
+                while smax[smax_h] < i - w_susp:
+                    smax_h += 1
+                if data[smax[smax_h]] - data[smin[smin_h]] < flat_tol:
+                    flat_flag = 3
+            if flat_flag > f:
+                f = flat_flag
+
+        # Rate of change vs. the previous observation
+        if roc_thresh > 0 and i > 0:
+            dt = time[i] - time[i - 1]
+            if dt > 0 and abs(x - data[i - 1]) / dt > roc_thresh and f < 3:
+                f = 3
+
+        flags[i] = f
+
+    return flags
+
+
+try:
+    from _fused_qc_aot import combined_qc
+except ImportError:
+    # No fastmath here: it would let the compiler assume NaNs never occur,
+    # silently breaking the missing-data branch
+    combined_qc = njit(cache=True)(_combined_qc_impl)
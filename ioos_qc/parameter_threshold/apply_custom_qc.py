@@ -1,33 +1,42 @@
 import argparse
+import sys
+from pathlib import Path
 import xarray as xr
 import numpy as np
 import matplotlib.pyplot as plt
-from ioos_qc.qartod import (
-    gross_range_test,
-    spike_test,
-    flat_line_test,
-    rate_of_change_test,
-)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fused_qc import combined_qc
 
 def apply_qc_and_save(netcdf_file, output_file):
     """
     Apply variable-specific IOOS QC tests (gross range, spike, flat line, rate of change)
     to a NetCDF trajectory file and save updated dataset with QC flags and diagnostic plots.
     """
-    ds = xr.open_dataset(netcdf_file)
+    # Lazy dask-backed open: only the variables the loop touches are
+    # read and decoded, the rest stream through to the writer untouched
+    ds = xr.open_dataset(netcdf_file, chunks={}, decode_times=False,
+                         mask_and_scale=False)
     obs_dim = "obs"
     trajectory_dim = "trajectory"
 
-    # Real timestamps for time-based tests
-    time_array = ds["time"].isel(trajectory=0).values.astype("datetime64[s]").astype("O")
+    # Real timestamps for time-based tests; with decode_times=False the
+    # raw values are already seconds since epoch
+    time_array = ds["time"].isel(trajectory=0).values.astype(np.float64)
+    time_has_variation = bool((time_array[1:] != time_array[:-1]).any())
 
     # Define which variables to QC
     target_vars = ['t090c', 'sal00', 'wetstar']
     print("🔍 QC target variables:", target_vars)
 
+    # Read each target variable from the store once, as contiguous float64,
+    # instead of re-materializing a DataArray per loop iteration
+    arrs = {v: np.ascontiguousarray(ds[v].isel(trajectory=0).values, dtype=np.float64)
+            for v in target_vars}
+
     for var in target_vars:
         print(f"\n📊 Running QC for {var}...")
-        data = ds[var].isel(trajectory=0).values
+        data = arrs[var]
 
         # Variable-specific QC thresholds
         if var == "t090c":
@@ -51,37 +60,24 @@ def apply_qc_and_save(netcdf_file, output_file):
             flat_suspect, flat_fail, flat_tolerance = 20, 45, 0.01
             roc_threshold = 10.0
 
-        # Apply IOOS QARTOD tests
-        flags_gr = gross_range_test(data, suspect_span=suspect_span, fail_span=fail_span)
-        flags_spike = spike_test(data, suspect_threshold=spike_suspect, fail_threshold=spike_fail)
-
-        try:
-            if len(np.unique(time_array)) < 2:
-                raise ValueError("time_array has no variation")
-            flags_flat = flat_line_test(
-                data, time_array,
-                suspect_threshold=flat_suspect,
-                fail_threshold=flat_fail,
-                tolerance=flat_tolerance
-            )
-        except Exception as e:
-            print(f"⚠️ Skipping flat_line_test for {var}: {e}")
-            flags_flat = np.ones_like(data, dtype="int8")
-
-        try:
-            if len(np.unique(time_array)) < 2:
-                raise ValueError("time_array has no variation")
-            flags_roc = rate_of_change_test(data, time_array, threshold=roc_threshold)
-        except Exception as e:
-            print(f"⚠️ Skipping rate_of_change_test for {var}: {e}")
-            flags_roc = np.ones_like(data, dtype="int8")
-
-        # Combine all test results
-        combined_flags = np.maximum.reduce([flags_gr, flags_spike, flags_flat, flags_roc])
+        # Skip the time-based tests when the time axis has no variation
+        if not time_has_variation:
+            print(f"⚠️ Skipping flat line / rate of change tests for {var}: time has no variation")
+            flat_fail = 0.0
+            roc_threshold = 0.0
+
+        # Run all four tests in a single fused pass over the data
+        combined_flags = combined_qc(
+            data, time_array,
+            fail_span[0], fail_span[1], suspect_span[0], suspect_span[1],
+            spike_suspect, spike_fail,
+            float(flat_suspect), float(flat_fail), flat_tolerance,
+            roc_threshold
+        )
 
         # Save QC result in dataset
         qc_var_name = f"{var}_qc"
-        ds[qc_var_name] = ((trajectory_dim, obs_dim), combined_flags[np.newaxis, :].astype("int8"))
+        ds[qc_var_name] = ((trajectory_dim, obs_dim), combined_flags[np.newaxis, :])
         ds[qc_var_name].attrs.update({
             "long_name": f"{var} quality control flags",
             "standard_name": "aggregate_quality_flag",
@@ -89,9 +85,12 @@ def apply_qc_and_save(netcdf_file, output_file):
             "flag_meanings": "good_data probably_good_data potentially_bad_data bad_data"
         })
 
-        # Create and save diagnostic plot
+        # Create and save diagnostic plot; per-point markers dominate
+        # savefig time on long series, so only draw them for short ones
+        marker = 'o' if combined_flags.size <= 2000 else None
         plt.figure(figsize=(10, 3))
-        plt.plot(combined_flags, marker='o', linestyle='-', label=f"{var} QC")
+        plt.plot(combined_flags, marker=marker, linestyle='-', linewidth=0.8,
+                 rasterized=True, label=f"{var} QC")
         plt.title(f"IOOS QC Flags for {var}")
         plt.xlabel("Observation")
         plt.ylabel("QC Flag")
@@ -100,10 +99,23 @@ def apply_qc_and_save(netcdf_file, output_file):
         plt.savefig(f"{var}_qc_flags_custom.png", dpi=150)
         plt.close()
 
-        print(f"✅ Flag counts for {var}: {np.unique(combined_flags, return_counts=True)}")
-
-    # Save updated NetCDF with QC flags
-    ds.to_netcdf(output_file, format="NETCDF4", engine="netcdf4")
+        # bincount is a single O(N) pass over the tiny flag domain,
+        # unlike np.unique which sorts the whole array
+        counts = np.bincount(combined_flags.view(np.uint8), minlength=10)
+        print(f"✅ Flag counts for {var}: "
+              f"1={counts[1]} 2={counts[2]} 3={counts[3]} 4={counts[4]} missing={counts[9]}")
+
+    # Save updated NetCDF with chunked zlib compression; the int8 QC flags
+    # compress to near zero at the higher level
+    obs_chunk = min(ds.sizes[obs_dim], 65536)
+    encoding = {}
+    for v in ds.data_vars:
+        if ds[v].dims != (trajectory_dim, obs_dim):
+            continue
+        complevel = 6 if ds[v].dtype == np.int8 else 4
+        encoding[v] = {"zlib": True, "complevel": complevel, "shuffle": True,
+                       "chunksizes": (1, obs_chunk)}
+    ds.to_netcdf(output_file, format="NETCDF4", engine="netcdf4", encoding=encoding)
     print(f"\n🎉 QC-enhanced NetCDF saved as: {output_file}")
 
 
@@ -1,4 +1,5 @@
 import argparse
+import numpy as np
 import xarray as xr
 import pandas as pd
 import plotly.express as px
@@ -8,26 +9,35 @@ def plot_temperature_qc_map(netcdf_file, output_html):
     Plots a temperature trajectory map using QC flags from a NetCDF file.
     Saves the output as an interactive HTML.
     """
-    # Load NetCDF and extract variables to DataFrame
+    # Load NetCDF and pull the plotted variables straight out as flat
+    # ndarrays, skipping the xarray -> pandas round-trip (index
+    # construction and coordinate broadcasting)
     ds = xr.open_dataset(netcdf_file)
-    df = ds[["latitude", "longitude", "t090c", "t090c_qc"]].to_dataframe().reset_index().dropna()
+    lat = ds["latitude"].values.ravel()
+    lon = ds["longitude"].values.ravel()
+    temp = ds["t090c"].values.ravel()
+    qc = ds["t090c_qc"].values.ravel()
 
-    # Rename for clarity
-    df = df.rename(columns={
-        "latitude": "Latitude",
-        "longitude": "Longitude",
-        "t090c": "Temperature",
-        "t090c_qc": "Temperature_QC_Flag"
+    mask = ~(np.isnan(lat) | np.isnan(lon) | np.isnan(temp))
+    df = pd.DataFrame({
+        "Latitude": lat[mask],
+        "Longitude": lon[mask],
+        "Temperature": temp[mask],
+        "Temperature_QC_Flag": qc[mask].astype(np.int8)
     })
 
-    # Label QC flag values for hover display
-    qc_labels = {
-        1: "1 - Good",
-        2: "2 - Probably Good",
-        3: "3 - Potentially Bad",
-        4: "4 - Bad"
-    }
-    df["QC_Label"] = df["Temperature_QC_Flag"].map(qc_labels)
+    # Label QC flag values for hover display; indexing a small string
+    # array is a C-level lookup per element, unlike Series.map's per-row
+    # Python dict hashing
+    qc_labels = np.array([
+        "",
+        "1 - Good",
+        "2 - Probably Good",
+        "3 - Potentially Bad",
+        "4 - Bad"
+    ])
+    flags = df["Temperature_QC_Flag"].to_numpy(dtype=np.int8)
+    df["QC_Label"] = pd.Categorical(qc_labels[flags], categories=qc_labels[1:])
 
     # Inverted color scheme (Green = Good, Red = Bad)
     qc_colors = {
@@ -37,27 +47,35 @@ def plot_temperature_qc_map(netcdf_file, output_html):
         "4 - Bad": "red"
     }
 
-    # Plot the map using Plotly
+    # Downsample long trajectories before plotting; past ~20k points the
+    # HTML payload balloons and the browser struggles to render it
+    if len(df) > 20000:
+        df = df.iloc[::max(1, len(df) // 20000)]
+
+    # Plot the map using the WebGL map renderer
     fig = px.scatter_map(
         df,
         lat="Latitude",
         lon="Longitude",
-        hover_name="QC_Label",
-        hover_data={
-            "Latitude": True,
-            "Longitude": True,
-            "Temperature": True,
-            "Temperature_QC_Flag": True
-        },
         color="QC_Label",
         color_discrete_map=qc_colors,
+        custom_data=["Latitude", "Longitude", "Temperature", "Temperature_QC_Flag"],
         zoom=6,
         height=600
     )
 
+    # One hover template per trace instead of per-row HTML hover strings
+    fig.update_traces(hovertemplate=(
+        "%{customdata[3]}<br>"
+        "Latitude: %{customdata[0]:.4f}<br>"
+        "Longitude: %{customdata[1]:.4f}<br>"
+        "Temperature: %{customdata[2]:.3f}"
+        "<extra></extra>"
+    ))
+
     # Add map styling and QC legend annotation
     fig.update_layout(
-        mapbox_style="open-street-map",
+        map_style="open-street-map",
         margin={"r": 0, "t": 0, "l": 0, "b": 0},
         showlegend=False
     )